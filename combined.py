@@ -1,10 +1,308 @@
 import streamlit as st
-import requests
+import orjson
 import json
 import base64
-from datetime import datetime
-from mistralai import Mistral
-import re
+import hashlib
+from datetime import date
+from typing import TYPE_CHECKING
+from urllib.parse import urlparse
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential
+
+# mistralai, requests and pandas are heavy to import, so they are imported lazily
+# where first used to keep the initial page render fast
+if TYPE_CHECKING:
+    import requests
+    from mistralai import Mistral
+
+
+# Oracle Fusion REST resource root; the batch endpoint lives here too
+_FUSION_RESOURCES_PATH = "/fscmRestApi/resources/11.13.18.05"
+# onlyData drops HATEOAS links and fields trims the returned invoice to the
+# columns we display
+_INVOICES_QUERY = (
+    "?onlyData=true"
+    "&fields=InvoiceId,InvoiceNumber,InvoiceAmount,InvoiceDate,InvoiceCurrency,BusinessUnit"
+)
+# Longest Retry-After wait honoured on a Fusion 503, in seconds
+_FUSION_MAX_RETRY_AFTER = 30
+# Invoices per batch request, well under Fusion's 500-part limit
+_FUSION_BATCH_SIZE = 100
+
+# OCR text budget for the extraction prompt; longer documents are cut down
+# to their first and last pages, where invoice headers and totals live, and
+# then trimmed in the middle if still over budget
+_MAX_PROMPT_OCR_CHARS = 100_000
+_PROMPT_HEAD_PAGES = 3
+_PROMPT_TAIL_PAGES = 2
+
+# Prompt for structured field extraction; bump prompt_version in
+# _extract_invoice_fields whenever this changes
+_EXTRACTION_PROMPT_TEMPLATE = """
+Analyze this invoice text and extract the following information in JSON format:
+
+{{
+    "invoice_number": "invoice number",
+    "invoice_date": "date in YYYY-MM-DD format",
+    "invoice_amount": "total amount as number",
+    "supplier_name": "vendor/supplier name",
+    "supplier_address": "supplier address",
+    "currency": "currency code (default USD)",
+    "description": "invoice description or main service/product",
+    "line_items": [
+        {{
+            "description": "line item description",
+            "amount": "line amount as number"
+        }}
+    ]
+}}
+
+Invoice Text:
+{ocr_text}
+
+Return only the JSON object, no other text.
+"""
+
+
+@st.cache_resource
+def get_mistral_client(api_key: str) -> "Mistral":
+    """Return a Mistral client shared across reruns for the given API key."""
+    from mistralai import Mistral
+    
+    return Mistral(api_key=api_key)
+
+
+@st.cache_resource
+def get_fusion_session() -> "requests.Session":
+    """Return a keep-alive session for Oracle Fusion REST calls.
+
+    Only 503 responses, which Fusion returns before processing the request
+    (e.g. during maintenance), are retried with exponential backoff; Retry-After
+    is honoured up to _FUSION_MAX_RETRY_AFTER seconds. Other 5xx responses and
+    read errors are not retried, since Fusion may already have created the
+    invoice and re-sending it would create a duplicate.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+    
+    class _CappedRetry(Retry):
+        # urllib3 sleeps for the full Retry-After value otherwise
+        def parse_retry_after(self, retry_after: str) -> float:
+            return min(super().parse_retry_after(retry_after), _FUSION_MAX_RETRY_AFTER)
+    
+    retry = _CappedRetry(
+        total=5,
+        read=0,
+        backoff_factor=1,
+        status_forcelist=(503,),
+        allowed_methods=frozenset(["POST"]),
+        raise_on_status=False
+    )
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(max_retries=retry))
+    return session
+
+
+@st.cache_resource
+def get_fusion_batch_session() -> "requests.Session":
+    """Return a keep-alive session for Oracle Fusion batch calls.
+
+    Unlike get_fusion_session this never retries: a slow batch that times out
+    or returns 5xx may still be committed by Fusion, and re-sending it would
+    create duplicate invoices.
+    """
+    import requests
+    
+    return requests.Session()
+
+
+def _is_transient_mistral_error(exc: BaseException) -> bool:
+    """Return True for Mistral errors worth retrying: network failures, 429 and 5xx."""
+    import httpx
+    
+    if isinstance(exc, httpx.TransportError):
+        return True
+    
+    # SDK errors carry the HTTP status; checked by attribute so this works
+    # across mistralai versions
+    status_code = getattr(exc, "status_code", None)
+    return isinstance(status_code, int) and (status_code == 429 or status_code >= 500)
+
+
+@retry(
+    retry=retry_if_exception(_is_transient_mistral_error),
+    stop=stop_after_attempt(4),
+    wait=wait_exponential(multiplier=1, max=16),
+    reraise=True
+)
+def _process_ocr(client: "Mistral", model: str, document: dict):
+    """Call Mistral OCR, retrying transient failures with exponential backoff."""
+    return client.ocr.process(
+        model=model,
+        document=document,
+        include_image_base64=True
+    )
+
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def _run_mistral_ocr(
+    pdf_sha256: str, _pdf_bytes: bytes, model: str, api_key: str
+) -> tuple[str, ...]:
+    """Run Mistral OCR on a PDF and return the markdown of each page.
+
+    Cached on the PDF's SHA-256; the raw bytes are underscore-prefixed so
+    Streamlit leaves them out of the cache key.
+    """
+    client = get_mistral_client(api_key)
+    
+    # Build the data URL as bytes and decode once, so no intermediate
+    # base64 str copy of the PDF is kept alive
+    data_url = b"data:application/pdf;base64," + base64.b64encode(_pdf_bytes)
+    
+    document = {
+        "type": "document_url",
+        "document_url": data_url.decode("ascii")
+    }
+    del data_url
+    
+    # Process with Mistral OCR
+    ocr_response = _process_ocr(client, model, document)
+    
+    # Extract text
+    if hasattr(ocr_response, "pages"):
+        pages = ocr_response.pages
+    elif isinstance(ocr_response, list):
+        pages = ocr_response
+    else:
+        pages = []
+    
+    return tuple(page.markdown for page in pages)
+
+
+def _ocr_page_starts(pages: tuple[str, ...]) -> tuple[int, ...]:
+    """Return where each page starts in the pages joined with blank lines."""
+    starts = []
+    offset = 0
+    for page in pages:
+        starts.append(offset)
+        offset += len(page) + 2
+    return tuple(starts)
+
+
+def _ocr_prompt_text(ocr_text: str, page_starts: tuple[int, ...]) -> str:
+    """Return the OCR text to feed the extraction prompt.
+
+    page_starts are the page offsets into ocr_text (see _ocr_page_starts).
+    Anything over _MAX_PROMPT_OCR_CHARS keeps only its first and last pages,
+    and is then cut in the middle if it is still over the budget.
+    """
+    if len(ocr_text) <= _MAX_PROMPT_OCR_CHARS:
+        return ocr_text
+    
+    if len(page_starts) > _PROMPT_HEAD_PAGES + _PROMPT_TAIL_PAGES:
+        skipped = len(page_starts) - _PROMPT_HEAD_PAGES - _PROMPT_TAIL_PAGES
+        head_end = page_starts[_PROMPT_HEAD_PAGES] - 2
+        tail_start = page_starts[-_PROMPT_TAIL_PAGES]
+        ocr_text = (
+            f"{ocr_text[:head_end]}\n\n[... {skipped} pages omitted ...]\n\n"
+            f"{ocr_text[tail_start:]}"
+        )
+    
+    if len(ocr_text) > _MAX_PROMPT_OCR_CHARS:
+        half = _MAX_PROMPT_OCR_CHARS // 2
+        ocr_text = f"{ocr_text[:half]}\n\n[... text omitted ...]\n\n{ocr_text[-half:]}"
+    
+    return ocr_text
+
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def _extract_invoice_fields(
+    api_key: str,
+    ocr_text: str,
+    model: str = "mistral-large-latest",
+    prompt_version: int = 2
+) -> dict:
+    """Extract structured invoice fields from OCR text with a Mistral chat call.
+
+    Cached on the OCR text, model and prompt_version; bump prompt_version
+    whenever the prompt changes so stale results are not reused.
+    """
+    client = get_mistral_client(api_key)
+    
+    extraction_prompt = _EXTRACTION_PROMPT_TEMPLATE.format(ocr_text=ocr_text)
+    
+    # JSON mode guarantees a parseable object; temperature 0
+    # keeps the output deterministic for the same OCR text
+    chat_response = client.chat.complete(
+        model=model,
+        messages=[{"role": "user", "content": extraction_prompt}],
+        response_format={"type": "json_object"},
+        temperature=0
+    )
+    
+    extracted_json = chat_response.choices[0].message.content
+    
+    # Trim anything outside the outermost braces (e.g. code fences) with a
+    # linear scan rather than a regex
+    start = extracted_json.find("{")
+    end = extracted_json.rfind("}")
+    if start >= 0 and end > start:
+        extracted_json = extracted_json[start:end + 1]
+    
+    return json.loads(extracted_json)
+
+
+def _update_fusion_urls() -> None:
+    """Parse the sidebar Fusion URL and cache the REST endpoints in session state.
+
+    Runs as an on_change callback. Only https URLs on an oraclecloud.com host
+    are accepted; any path the user pasted (e.g. /fscmRestApi) is dropped.
+    URLs with embedded credentials are rejected, since requests would send
+    them in place of the sidebar Authorization header.
+    """
+    parsed = urlparse(st.session_state.get("fusion_url", "").strip())
+    hostname = parsed.hostname or ""
+    try:
+        port = parsed.port
+    except ValueError:
+        hostname, port = "", None
+    
+    if (
+        parsed.scheme.lower() == "https"
+        and hostname.endswith(".oraclecloud.com")
+        and parsed.username is None
+        and parsed.password is None
+    ):
+        base = f"https://{hostname}" if port is None else f"https://{hostname}:{port}"
+        st.session_state["_fusion_base"] = base
+        st.session_state["_invoices_url"] = f"{base}{_FUSION_RESOURCES_PATH}/invoices{_INVOICES_QUERY}"
+        st.session_state["_batch_url"] = f"{base}{_FUSION_RESOURCES_PATH}"
+    else:
+        st.session_state["_fusion_base"] = None
+        st.session_state["_invoices_url"] = None
+        st.session_state["_batch_url"] = None
+
+
+def _update_auth_header() -> None:
+    """Rebuild the Fusion auth header in session state from the sidebar credentials.
+
+    Runs as an on_change callback, so the header is only re-encoded when the
+    credentials actually change rather than on every submit.
+    """
+    if st.session_state.get("auth_method") == "Basic Auth":
+        username = st.session_state.get("fusion_username")
+        password = st.session_state.get("fusion_password")
+        if username and password:
+            credentials = base64.b64encode(f"{username}:{password}".encode()).decode()
+            st.session_state["_auth_header"] = {"Authorization": f"Basic {credentials}"}
+        else:
+            st.session_state["_auth_header"] = None
+    else:
+        access_token = st.session_state.get("fusion_access_token")
+        st.session_state["_auth_header"] = (
+            {"Authorization": f"Bearer {access_token}"} if access_token else None
+        )
+
 
 # Set page config
 st.set_page_config(
@@ -17,12 +315,15 @@ st.title("🧾 Oracle Fusion Invoice Creator with PDF OCR")
 st.markdown("Upload an invoice PDF, extract data with AI, and create AP invoices in Oracle Fusion")
 
 # Initialize session state
-if "ocr_result" not in st.session_state:
-    st.session_state["ocr_result"] = None
-if "extracted_data" not in st.session_state:
-    st.session_state["extracted_data"] = {}
-if "pdf_processed" not in st.session_state:
-    st.session_state["pdf_processed"] = False
+st.session_state.setdefault("ocr_text", None)
+st.session_state.setdefault("ocr_page_starts", ())
+st.session_state.setdefault("extracted_data", {})
+st.session_state.setdefault("pdf_processed", False)
+st.session_state.setdefault("pending_invoices", [])
+st.session_state.setdefault("_auth_header", None)
+st.session_state.setdefault("_fusion_base", None)
+st.session_state.setdefault("_invoices_url", None)
+st.session_state.setdefault("_batch_url", None)
 
 # Sidebar for API configurations
 st.sidebar.header("🔧 API Configuration")
@@ -32,19 +333,38 @@ mistral_api_key = st.sidebar.text_input("Mistral API Key", type="password")
 
 # Oracle Fusion Configuration
 st.sidebar.subheader("Oracle Fusion Settings")
-auth_method = st.sidebar.selectbox("Authentication Method", ["Basic Auth", "OAuth2"])
+auth_method = st.sidebar.selectbox(
+    "Authentication Method",
+    ["Basic Auth", "OAuth2"],
+    key="auth_method",
+    on_change=_update_auth_header
+)
 
 if auth_method == "Basic Auth":
-    username = st.sidebar.text_input("Username", type="password")
-    password = st.sidebar.text_input("Password", type="password")
+    st.sidebar.text_input(
+        "Username", type="password", key="fusion_username", on_change=_update_auth_header
+    )
+    st.sidebar.text_input(
+        "Password", type="password", key="fusion_password", on_change=_update_auth_header
+    )
 else:
-    access_token = st.sidebar.text_input("Access Token", type="password")
+    st.sidebar.text_input(
+        "Access Token", type="password", key="fusion_access_token", on_change=_update_auth_header
+    )
+
+auth_header = st.session_state["_auth_header"]
 
 fusion_url = st.sidebar.text_input(
     "Oracle Fusion Base URL",
-    placeholder="https://your-instance.oraclecloud.com"
+    placeholder="https://your-instance.oraclecloud.com",
+    key="fusion_url",
+    on_change=_update_fusion_urls
 )
 
+fusion_base = st.session_state["_fusion_base"]
+if fusion_url and not fusion_base:
+    st.sidebar.error("❌ Enter an https:// URL on an oraclecloud.com host, without credentials")
+
 # Step 1: PDF Upload and OCR Processing
 st.header("📄 Step 1: Upload Invoice PDF")
 
@@ -54,34 +374,19 @@ if uploaded_file and mistral_api_key:
     if st.button("🔍 Extract Invoice Data", type="primary"):
         with st.spinner("Processing PDF with Mistral OCR..."):
             try:
-                client = Mistral(api_key=mistral_api_key)
-                
-                # Read and encode PDF
-                file_bytes = uploaded_file.read()
-                encoded_pdf = base64.b64encode(file_bytes).decode("utf-8")
-                
-                document = {
-                    "type": "document_url",
-                    "document_url": f"data:application/pdf;base64,{encoded_pdf}"
-                }
-                
-                # Process with Mistral OCR
-                ocr_response = client.ocr.process(
-                    model="mistral-ocr-latest",
-                    document=document,
-                    include_image_base64=True
+                # Read PDF and run OCR (cached on file hash)
+                # getvalue() doesn't move the file cursor, so repeat clicks
+                # always see the full PDF
+                pdf_bytes = uploaded_file.getvalue()
+                pdf_sha256 = hashlib.sha256(pdf_bytes).hexdigest()
+                ocr_pages = _run_mistral_ocr(
+                    pdf_sha256, pdf_bytes, "mistral-ocr-2505", mistral_api_key
                 )
                 
-                # Extract text
-                if hasattr(ocr_response, "pages"):
-                    pages = ocr_response.pages
-                elif isinstance(ocr_response, list):
-                    pages = ocr_response
-                else:
-                    pages = []
-                
-                result_text = "\n\n".join(page.markdown for page in pages)
-                st.session_state["ocr_result"] = result_text
+                # Keep one joined copy plus page offsets rather than the
+                # pages themselves, and join once here rather than per rerun
+                st.session_state["ocr_text"] = "\n\n".join(ocr_pages)
+                st.session_state["ocr_page_starts"] = _ocr_page_starts(ocr_pages)
                 st.session_state["pdf_processed"] = True
                 
                 st.success("✅ PDF processed successfully!")
@@ -90,11 +395,11 @@ if uploaded_file and mistral_api_key:
                 st.error(f"❌ Error processing PDF: {str(e)}")
 
 # Display OCR result and data extraction
-if st.session_state["pdf_processed"] and st.session_state["ocr_result"]:
+if st.session_state["pdf_processed"] and st.session_state["ocr_text"]:
     
     # Show OCR result
     with st.expander("📋 Raw OCR Text", expanded=False):
-        st.text_area("Extracted Text", st.session_state["ocr_result"], height=200)
+        st.text_area("Extracted Text", st.session_state["ocr_text"], height=200)
     
     # Step 2: Smart Data Extraction
     st.header("🤖 Step 2: Extract Invoice Fields")
@@ -102,249 +407,366 @@ if st.session_state["pdf_processed"] and st.session_state["ocr_result"]:
     if st.button("🧠 Auto-Extract Invoice Data"):
         with st.spinner("Extracting invoice fields with AI..."):
             try:
-                # Use another Mistral call to structure the data
-                client = Mistral(api_key=mistral_api_key)
-                
-                extraction_prompt = f"""
-                Analyze this invoice text and extract the following information in JSON format:
-                
-                {{
-                    "invoice_number": "invoice number",
-                    "invoice_date": "date in YYYY-MM-DD format",
-                    "invoice_amount": "total amount as number",
-                    "supplier_name": "vendor/supplier name",
-                    "supplier_address": "supplier address",
-                    "currency": "currency code (default USD)",
-                    "description": "invoice description or main service/product",
-                    "line_items": [
-                        {{
-                            "description": "line item description",
-                            "amount": "line amount as number"
-                        }}
-                    ]
-                }}
-                
-                Invoice Text:
-                {st.session_state["ocr_result"]}
-                
-                Return only the JSON object, no other text.
-                """
-                
-                chat_response = client.chat.complete(
-                    model="mistral-large-latest",
-                    messages=[{"role": "user", "content": extraction_prompt}]
-                )
-                
-                # Parse the response
-                extracted_json = chat_response.choices[0].message.content
-                
-                # Clean up the response to extract JSON
-                json_match = re.search(r'\{.*\}', extracted_json, re.DOTALL)
-                if json_match:
-                    extracted_data = json.loads(json_match.group())
+                # Use another Mistral call to structure the data (cached on OCR text)
+                try:
+                    extracted_data = _extract_invoice_fields(
+                        mistral_api_key,
+                        _ocr_prompt_text(st.session_state["ocr_text"], st.session_state["ocr_page_starts"])
+                    )
+                except json.JSONDecodeError:
+                    st.error("❌ Could not parse extracted data")
+                else:
                     st.session_state["extracted_data"] = extracted_data
                     st.success("✅ Invoice data extracted successfully!")
-                else:
-                    st.error("❌ Could not parse extracted data")
                     
             except Exception as e:
                 st.error(f"❌ Error extracting data: {str(e)}")
     
     # Step 3: Review and Edit Extracted Data
     if st.session_state["extracted_data"]:
-        st.header("✏️ Step 3: Review & Edit Invoice Data")
+        import pandas as pd
         
-        col1, col2 = st.columns(2)
+        st.header("✏️ Step 3: Review & Edit Invoice Data")
         
-        with col1:
-            st.subheader("Invoice Header")
+        # Edit inside a form so typing doesn't rerun the script; it only
+        # reruns when one of the submit buttons is pressed
+        with st.form("invoice_edit_form", clear_on_submit=False):
+            col1, col2 = st.columns(2)
             
-            # Oracle-specific required fields
-            business_unit = st.text_input(
-                "Business Unit *", 
-                help="Required - Oracle Fusion Business Unit code"
-            )
+            with col1:
+                st.subheader("Invoice Header")
+                
+                # Oracle-specific required fields
+                business_unit = st.text_input(
+                    "Business Unit *", 
+                    help="Required - Oracle Fusion Business Unit code"
+                )
+                
+                supplier_name = st.text_input(
+                    "Supplier Name *", 
+                    value=st.session_state["extracted_data"].get("supplier_name", "")
+                )
+                
+                supplier_site = st.text_input(
+                    "Supplier Site *", 
+                    help="Required - Must exist in Oracle Fusion"
+                )
+                
+                invoice_number = st.text_input(
+                    "Invoice Number *", 
+                    value=st.session_state["extracted_data"].get("invoice_number", "")
+                )
+                
+                invoice_amount = st.number_input(
+                    "Invoice Amount *", 
+                    value=float(st.session_state["extracted_data"].get("invoice_amount", 0)),
+                    min_value=0.01,
+                    step=0.01
+                )
+                
+                # Parse date from extracted data
+                extracted_date = st.session_state["extracted_data"].get("invoice_date", "")
+                try:
+                    default_date = date.fromisoformat(extracted_date)
+                except (ValueError, TypeError):
+                    default_date = date.today()
+                
+                invoice_date = st.date_input("Invoice Date *", value=default_date)
             
-            supplier_name = st.text_input(
-                "Supplier Name *", 
-                value=st.session_state["extracted_data"].get("supplier_name", "")
-            )
+            with col2:
+                st.subheader("Additional Details")
+                
+                invoice_currency = st.text_input(
+                    "Currency *", 
+                    value=st.session_state["extracted_data"].get("currency", "USD")
+                )
+                
+                payment_terms = st.text_input("Payment Terms", placeholder="e.g., NET30")
+                
+                invoice_group = st.text_input("Invoice Group", help="Optional")
+                
+                description = st.text_area(
+                    "Description", 
+                    value=st.session_state["extracted_data"].get("description", "")
+                )
             
-            supplier_site = st.text_input(
-                "Supplier Site *", 
-                help="Required - Must exist in Oracle Fusion"
-            )
+            # Invoice Lines
+            st.subheader("Invoice Lines")
             
-            invoice_number = st.text_input(
-                "Invoice Number *", 
-                value=st.session_state["extracted_data"].get("invoice_number", "")
-            )
+            # Auto-populate from extracted data
+            extracted_lines = st.session_state["extracted_data"].get("line_items", [])
+            if not extracted_lines:
+                # Seed from the extracted total, not the live widget, so the
+                # grid's input data (and the user's edits) survive reruns
+                extracted_lines = [
+                    {
+                        "description": "Service",
+                        "amount": st.session_state["extracted_data"].get("invoice_amount", 0)
+                    }
+                ]
             
-            invoice_amount = st.number_input(
-                "Invoice Amount *", 
-                value=float(st.session_state["extracted_data"].get("invoice_amount", 0)),
-                min_value=0.01,
-                step=0.01
+            # A single grid instead of two widgets per line; rows can be added,
+            # removed or pasted in from a spreadsheet
+            lines_df = pd.DataFrame(
+                {
+                    "amount": [float(line["amount"]) for line in extracted_lines],
+                    "dist_comb": [""] * len(extracted_lines)
+                }
             )
             
-            # Parse date from extracted data
-            extracted_date = st.session_state["extracted_data"].get("invoice_date", "")
-            try:
-                if extracted_date:
-                    invoice_date = st.date_input(
-                        "Invoice Date *", 
-                        value=datetime.strptime(extracted_date, "%Y-%m-%d").date()
+            edited_lines = st.data_editor(
+                lines_df,
+                num_rows="dynamic",
+                width="stretch",
+                hide_index=True,
+                key="invoice_lines",
+                column_config={
+                    "amount": st.column_config.NumberColumn(
+                        "Amount *", min_value=0.01, step=0.01, required=True
+                    ),
+                    "dist_comb": st.column_config.TextColumn(
+                        "Distribution Combination *",
+                        help="Chart of Accounts combination, e.g. 101.10.52496.120.000.000",
+                        required=True
                     )
-                else:
-                    invoice_date = st.date_input("Invoice Date *", value=datetime.now().date())
-            except:
-                invoice_date = st.date_input("Invoice Date *", value=datetime.now().date())
-        
-        with col2:
-            st.subheader("Additional Details")
-            
-            invoice_currency = st.text_input(
-                "Currency *", 
-                value=st.session_state["extracted_data"].get("currency", "USD")
+                }
             )
             
-            payment_terms = st.text_input("Payment Terms", placeholder="e.g., NET30")
+            # Blank cells in newly added rows come back as None/NaN
+            lines_data = [
+                {
+                    "amount": 0.0 if pd.isna(line["amount"]) else float(line["amount"]),
+                    "dist_comb": "" if pd.isna(line["dist_comb"]) else str(line["dist_comb"]).strip()
+                }
+                for line in edited_lines.to_dict("records")
+            ]
             
-            invoice_group = st.text_input("Invoice Group", help="Optional")
+            # Step 4: Create Oracle Invoice
+            st.header("🚀 Step 4: Create Oracle Fusion Invoice")
             
-            description = st.text_area(
-                "Description", 
-                value=st.session_state["extracted_data"].get("description", "")
-            )
-        
-        # Invoice Lines
-        st.subheader("Invoice Lines")
-        
-        # Auto-populate from extracted data
-        extracted_lines = st.session_state["extracted_data"].get("line_items", [])
-        if not extracted_lines:
-            extracted_lines = [{"description": "Service", "amount": invoice_amount}]
-        
-        num_lines = st.number_input(
-            "Number of Lines", 
-            min_value=1, 
-            max_value=10, 
-            value=len(extracted_lines)
-        )
-        
-        lines_data = []
-        for i in range(num_lines):
-            st.write(f"**Line {i+1}**")
             col1, col2 = st.columns(2)
             
             with col1:
-                line_amount = st.number_input(
-                    f"Amount {i+1} *",
-                    value=float(extracted_lines[i]["amount"]) if i < len(extracted_lines) else 0.0,
-                    min_value=0.01,
-                    step=0.01,
-                    key=f"amount_{i}"
+                create_submitted = st.form_submit_button(
+                    "📤 Create Invoice in Oracle", type="primary"
                 )
             
             with col2:
-                distribution_comb = st.text_input(
-                    f"Distribution Combination {i+1} *",
-                    placeholder="e.g., 101.10.52496.120.000.000",
-                    key=f"dist_{i}",
-                    help="Chart of Accounts combination"
+                queue_invoice = st.form_submit_button(
+                    "➕ Add Invoice to Queue",
+                    help="Queue several invoices and create them in a single batch request"
                 )
-            
-            lines_data.append({
-                "amount": line_amount,
-                "dist_comb": distribution_comb
-            })
-        
-        # Step 4: Create Oracle Invoice
-        st.header("🚀 Step 4: Create Oracle Fusion Invoice")
         
-        if st.button("📤 Create Invoice in Oracle", type="primary"):
-            # Validation
-            required_fields = [
-                business_unit, supplier_name, supplier_site, 
-                invoice_number, fusion_url, invoice_currency
-            ]
+        if create_submitted or queue_invoice:
+            # Validation - report the first missing field, checking
+            # connection settings before invoice fields. Credentials are
+            # checked via auth_header, the same value the request is built from
+            credentials_label = "Username and Password" if auth_method == "Basic Auth" else "Access Token"
             
-            if auth_method == "Basic Auth":
-                required_fields.extend([username, password])
-            else:
-                required_fields.append(access_token)
+            missing_field = next(
+                (
+                    name for name, value in (
+                        ("Oracle Fusion Base URL", fusion_base),
+                        (credentials_label, auth_header),
+                        ("Business Unit", business_unit),
+                        ("Supplier Name", supplier_name),
+                        ("Supplier Site", supplier_site),
+                        ("Invoice Number", invoice_number),
+                        ("Currency", invoice_currency)
+                    )
+                    if not value
+                ),
+                None
+            )
             
-            if not all(required_fields):
-                st.error("❌ Please fill in all required fields marked with *")
+            if missing_field:
+                st.error(f"❌ Please fill in the required field: {missing_field}")
             elif invoice_amount <= 0:
                 st.error("❌ Invoice amount must be greater than 0")
-            elif abs(sum(line["amount"] for line in lines_data) - invoice_amount) > 1e-6:
+            # Compare in integer cents to avoid float rounding noise
+            elif sum(round(line["amount"] * 100) for line in lines_data) != round(invoice_amount * 100):
                 st.error("❌ Sum of line amounts must equal invoice amount")
             elif not all(line["dist_comb"] for line in lines_data):
                 st.error("❌ All lines must have distribution combinations")
             else:
-                try:
-                    # Create authentication header
-                    if auth_method == "Basic Auth":
-                        credentials = base64.b64encode(f"{username}:{password}".encode()).decode()
-                        auth_header = {"Authorization": f"Basic {credentials}"}
-                    else:
-                        auth_header = {"Authorization": f"Bearer {access_token}"}
-                    
-                    # Build payload
-                    invoice_lines = []
-                    for idx, line in enumerate(lines_data):
-                        line_payload = {
-                            "LineNumber": idx + 1,
-                            "LineAmount": line["amount"],
-                            "AccountingDate": invoice_date.strftime("%Y-%m-%d"),
-                            "DistributionCombination": line["dist_comb"]
-                        }
-                        invoice_lines.append(line_payload)
-                    
-                    payload = {
-                        "InvoiceNumber": invoice_number,
-                        "InvoiceCurrency": invoice_currency,
-                        "InvoiceAmount": invoice_amount,
-                        "InvoiceDate": invoice_date.strftime("%Y-%m-%d"),
-                        "BusinessUnit": business_unit,
-                        "Supplier": supplier_name,
-                        "SupplierSite": supplier_site,
-                        "InvoiceGroup": invoice_group,
-                        "Description": description,
-                        "invoiceLines": invoice_lines
-                    }
-                    
-                    # API call
-                    api_endpoint = f"{fusion_url.rstrip('/')}/fscmRestApi/resources/11.13.18.05/invoices"
-                    headers = {
-                        "Content-Type": "application/vnd.oracle.adf.resourceitem+json",
-                        "Accept": "application/json",
-                        **auth_header
+                # Build payload
+                invoice_lines = []
+                for idx, line in enumerate(lines_data):
+                    line_payload = {
+                        "LineNumber": idx + 1,
+                        "LineAmount": line["amount"],
+                        "AccountingDate": invoice_date,
+                        "DistributionCombination": line["dist_comb"]
                     }
+                    invoice_lines.append(line_payload)
+                
+                payload = {
+                    "InvoiceNumber": invoice_number,
+                    "InvoiceCurrency": invoice_currency,
+                    "InvoiceAmount": invoice_amount,
+                    "InvoiceDate": invoice_date,
+                    "BusinessUnit": business_unit,
+                    "Supplier": supplier_name,
+                    "SupplierSite": supplier_site,
+                    "InvoiceGroup": invoice_group,
+                    "Description": description,
+                    "invoiceLines": invoice_lines
+                }
+                
+                if queue_invoice:
+                    pending_invoices = st.session_state["pending_invoices"]
                     
-                    with st.expander("📋 Review API Payload"):
-                        st.json(payload)
-                    
-                    with st.spinner("Creating invoice in Oracle Fusion..."):
-                        response = requests.post(
-                            api_endpoint, 
-                            headers=headers, 
-                            json=payload, 
-                            timeout=30
+                    # Queuing the same invoice twice would create it twice
+                    # (or fail the whole batch on the duplicate number)
+                    if any(
+                        queued["InvoiceNumber"] == invoice_number
+                        and queued["Supplier"] == supplier_name
+                        for queued in pending_invoices
+                    ):
+                        st.warning(
+                            f"⚠️ Invoice {invoice_number} from {supplier_name} is already queued"
+                        )
+                    else:
+                        pending_invoices.append(payload)
+                        st.success(
+                            f"✅ Invoice {invoice_number} queued "
+                            f"({len(pending_invoices)} pending)"
                         )
+                else:
+                    from requests.exceptions import RequestException
                     
-                    if response.status_code in (200, 201):
-                        st.success("🎉 Invoice created successfully in Oracle Fusion!")
-                        st.json(response.json())
+                    try:
+                        # API call
+                        api_endpoint = st.session_state["_invoices_url"]
+                        headers = {
+                            "Content-Type": "application/vnd.oracle.adf.resourceitem+json",
+                            "Accept": "application/json",
+                            **auth_header
+                        }
+                        
+                        # orjson serialises the date fields as YYYY-MM-DD
+                        body = orjson.dumps(payload)
+                        
+                        with st.expander("📋 Review API Payload"):
+                            st.json(body.decode())
+                        
+                        with st.spinner("Creating invoice in Oracle Fusion..."):
+                            response = get_fusion_session().post(
+                                api_endpoint, 
+                                headers=headers, 
+                                data=body, 
+                                timeout=30
+                            )
+                        
+                        if response.status_code in (200, 201):
+                            st.success("🎉 Invoice created successfully in Oracle Fusion!")
+                            st.json(orjson.loads(response.content))
+                        else:
+                            st.error(f"❌ Error creating invoice: {response.status_code}")
+                            st.error(f"Response: {response.text}")
+                            
+                    except RequestException as e:
+                        st.error(f"❌ Network error: {str(e)}")
+                    except Exception as e:
+                        st.error(f"❌ Unexpected error: {str(e)}")
+
+# Batch submission of queued invoices
+if st.session_state["pending_invoices"]:
+    pending_invoices = st.session_state["pending_invoices"]
+    
+    st.header("📦 Queued Invoices")
+    st.write(f"{len(pending_invoices)} invoice(s) waiting for batch submission")
+    
+    with st.expander("📋 Review Queued Invoices"):
+        st.json(orjson.dumps(pending_invoices).decode())
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        submit_batch = st.button(
+            f"📤 Submit {len(pending_invoices)} Queued Invoice(s)", type="primary"
+        )
+    
+    with col2:
+        if st.button("🗑️ Clear Queue"):
+            pending_invoices.clear()
+            st.rerun()
+    
+    if submit_batch:
+        if not fusion_base or not auth_header:
+            st.error("❌ Please fill in the Oracle Fusion Base URL and credentials")
+        else:
+            from requests.exceptions import RequestException, Timeout
+            
+            batch_endpoint = st.session_state["_batch_url"]
+            headers = {
+                "Content-Type": "application/vnd.oracle.adf.batch+json",
+                "Accept": "application/json",
+                **auth_header
+            }
+            
+            # Shown when Fusion may have committed a batch we got no answer for
+            batch_unknown_warning = (
+                "⚠️ Fusion may still have created some of these invoices. "
+                "Check Payables in Fusion before resubmitting or clearing the queue."
+            )
+            
+            try:
+                with st.spinner("Creating queued invoices in Oracle Fusion..."):
+                    # Send one batch request per chunk; created invoices
+                    # leave the queue so a failed chunk can be retried
+                    while pending_invoices:
+                        chunk = pending_invoices[:_FUSION_BATCH_SIZE]
+                        batch_payload = {
+                            "parts": [
+                                {
+                                    "id": f"part{idx + 1}",
+                                    "path": "/invoices",
+                                    "operation": "create",
+                                    "payload": invoice
+                                }
+                                for idx, invoice in enumerate(chunk)
+                            ]
+                        }
+                        
+                        response = get_fusion_batch_session().post(
+                            batch_endpoint,
+                            headers=headers,
+                            data=orjson.dumps(batch_payload),
+                            timeout=120
+                        )
+                        
+                        if response.status_code not in (200, 201):
+                            st.error(f"❌ Error creating invoice batch: {response.status_code}")
+                            st.error(f"Response: {response.text}")
+                            if response.status_code >= 500:
+                                st.warning(batch_unknown_warning)
+                            break
+                        
+                        del pending_invoices[:len(chunk)]
+                        
+                        # Show one line per created invoice rather than every
+                        # full invoice resource in the batch response
+                        batch_result = orjson.loads(response.content)
+                        st.json(
+                            [
+                                {
+                                    "InvoiceId": part.get("payload", {}).get("InvoiceId"),
+                                    "InvoiceNumber": part.get("payload", {}).get("InvoiceNumber")
+                                }
+                                for part in batch_result.get("parts", [])
+                            ]
+                        )
                     else:
-                        st.error(f"❌ Error creating invoice: {response.status_code}")
-                        st.error(f"Response: {response.text}")
+                        st.success("🎉 All queued invoices created successfully in Oracle Fusion!")
                         
-                except requests.exceptions.RequestException as e:
-                    st.error(f"❌ Network error: {str(e)}")
-                except Exception as e:
-                    st.error(f"❌ Unexpected error: {str(e)}")
+            except Timeout as e:
+                st.error(f"❌ Network error: {str(e)}")
+                st.warning(batch_unknown_warning)
+            except RequestException as e:
+                st.error(f"❌ Network error: {str(e)}")
+            except Exception as e:
+                st.error(f"❌ Unexpected error: {str(e)}")
 
 # Information sections
 st.sidebar.markdown("---")
@@ -376,7 +798,8 @@ with st.expander("📖 How to Use This Tool"):
        - Supplier Site (must be active)
        - Distribution Combinations (valid Chart of Accounts)
     
-    6. **Create Invoice**: Submit to Oracle Fusion Payables
+    6. **Create Invoice**: Submit to Oracle Fusion Payables, or use "Add Invoice to Queue" to
+       collect several invoices and create them together in one batch request
     
     ### Important Notes:
     - Ensure your Oracle user has Payables Invoice Entry privileges